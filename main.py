@@ -1,8 +1,41 @@
 """
 Main module for calculating and plotting energy as a function of x for chosen material
 """
-from math import pi,log,sqrt
+from concurrent.futures import ThreadPoolExecutor
+from math import pi,sqrt
+import multiprocessing
+import os
+from typing import NamedTuple
+import numpy as np
+import matplotlib
+import matplotlib.image
 import matplotlib.pyplot as plt
+
+class BandParameters(NamedTuple):
+    """
+    Material parameters of the bands, each field is a tuple (a,b) where a
+    is the value of the first materials parameter (the one with 1-x as
+    index) and b is the value of the second materials parameter with the
+    exception of lattice_a_0 where only 1 value should be present
+    """
+    VBO: tuple
+    b: tuple
+    a_c: tuple
+    a_v: tuple
+    C_11: tuple
+    C_12: tuple
+    lattice_a: tuple
+    lattice_a_0: float
+
+class TemperatureParameters(NamedTuple):
+    """
+    Temperatures is a list of temperatures for which the calculations will
+    be done, alpha and beta are in the same format as in BandParameters
+    """
+    Temperatures: list
+    alpha: tuple
+    beta: tuple
+
 #############################
 ########    CONFIG    #######
 #############################
@@ -18,28 +51,24 @@ PARAMETERS_BANDGAP = [
     ,(0.93,1.133,0.6) #Point L
 ]
 PLOT_BANDS = True
-PARAMETERS_BANDS = {
-    # Format should be a tuple containing (a,b) where a is the value
-    # of the first materials parameter (the one with 1-x as index) and
-    # b is the value of the second materials parameter with the exception
-    # of lattice_a_0 where only 1 value should be present
-    "VBO": (0 , -0.59),
-    "b":(-2.0 , -1.8),
-    "a_c":(-6.94 , -5.08),
-    "a_v":(-0.36 , -1.00),
-    "C_11":(684.7 , 832.9),
-    "C_12":(373.5 , 452.6),
-    "lattice_a": (6.4794, 6.0583),
-    "lattice_a_0": 6.0583,
-}
+PARAMETERS_BANDS = BandParameters(
+    # Format is described in BandParameters
+    VBO = (0 , -0.59),
+    b = (-2.0 , -1.8),
+    a_c = (-6.94 , -5.08),
+    a_v = (-0.36 , -1.00),
+    C_11 = (684.7 , 832.9),
+    C_12 = (373.5 , 452.6),
+    lattice_a = (6.4794, 6.0583),
+    lattice_a_0 = 6.0583,
+)
 TEMPERATURE_DEPENDENCE = True
-PARAMETERS_TEMPERATURE = {
-    # Temperatures is a list of temperatures for which the calculations will be done
-    # alpha and beta are in the same format as params in previous dictionary
-    "Temperatures" : [0, 10, 300],
-    "alpha" : (0.32*10**-3,0.276*10**-3),
-    "beta" : (170,93),
-}
+PARAMETERS_TEMPERATURE = TemperatureParameters(
+    # Format is described in TemperatureParameters
+    Temperatures = [0, 10, 300],
+    alpha = (0.32*10**-3,0.276*10**-3),
+    beta = (170,93),
+)
 QUANTUM_WELL_PARAMS = {
     "Well_widths":(100,200,300),
     "Compositions":(0.25,0.5,0.75)
@@ -55,11 +84,155 @@ LABELS = [
     r'L'
 ]
 FONT_SIZE = 20
+PLOT_DPI = 80
 SAVE_PLOT_AS_PNG = True
 SHOW_IMAGE = False
 
 #############################
 
+if not SHOW_IMAGE:
+    # Plots are only saved to files so no GUI backend is needed
+    matplotlib.use("Agg")
+
+_SQRT2 = sqrt(2)
+
+# PNG encoding runs in the threads of this executor while the next plot
+# is drawn, it's created by the first save, see get_save_executor
+_SAVE_EXECUTOR = None
+_PENDING_SAVES = []
+
+# Templates of quantum well plot titles and file names, width is in nm and
+# composition in percent, see get_quantum_well_labels
+_QUANTUM_WELL_TITLE = ('$ InAs_{{{x}}}Sb_{{{one_minus_x}}} $ - InAs base for '
+                       'T = {temperature}K and width = {width} nm')
+_QUANTUM_WELL_IMAGE_NAME = 'quantum_well_plots\\Quantum_well_{temperature}K_{width}nm_composition_{composition}.png'
+
+# Legend labels of the bands plotted against temperature, keyed like the
+# bands in main, see get_band_label
+_BAND_LABELS = {'EV':'$ E_V $',
+                'EC':'$ E_C ({temperature}K) $',
+                'ECS':'$ E_{{C-with-strain}} ({temperature}K) $',
+                'EHH':'$ E_{{HH}} $',
+                'ELH':'$ E_{{LH}} $'}
+
+# Figures reused between consecutive plots of the same kind, see
+# get_all_plots_figure and get_quantum_well_figure
+_FIGURES = {}
+
+# Positions [Å] across the quantum well structure and masks of the well
+# region for every width used so far, see get_well_mask
+_POSITION = np.arange(1001)
+_WELL_MASKS = {}
+
+# Compositions x in [0,1] shared by every calculation, read-only since
+# the same array is handed out to all callers
+_X = np.linspace(0.0, 1.0, 101)
+_X.setflags(write=False)
+
+# PARAMETERS_BANDS stored as two flat arrays (values for 1-x and x) indexed
+# by the row constants below, so all of them can be interpolated at once
+_BANDS_KEYS = ("VBO","b","a_c","a_v","C_11","C_12","lattice_a")
+_VBO,_B,_A_C,_A_V,_C_11,_C_12,_LATTICE_A = range(len(_BANDS_KEYS))
+_BANDS_A = np.array([getattr(PARAMETERS_BANDS,key)[0] for key in _BANDS_KEYS])
+_BANDS_B = np.array([getattr(PARAMETERS_BANDS,key)[1] for key in _BANDS_KEYS])
+_BANDS_DELTA = _BANDS_B - _BANDS_A
+
+def get_all_plots_figure():
+    """
+    Returns the cached figure used by create_all_plots, creating it on the
+    first call together with everything that is the same for all its plots
+
+    Returns:
+        Tuple (figure,axes)
+    """
+    if 'all_plots' not in _FIGURES:
+        figure, axes = plt.subplots(figsize=(20,16),dpi=PLOT_DPI)
+        axes.grid()
+        axes.set_ylabel("Energy [eV]",fontsize=FONT_SIZE)
+        axes.set_xlabel(X_LABEL,fontsize=FONT_SIZE)
+        axes.tick_params(axis='both',labelsize=FONT_SIZE-6)
+        _FIGURES['all_plots'] = (figure,axes)
+    return _FIGURES['all_plots']
+
+def close_figures():
+    """
+    Closes all the figures, including the cached ones
+    """
+    _FIGURES.clear()
+    plt.close('all')
+
+def get_quantum_well_figure():
+    """
+    Returns the cached quantum well figure, creating it on the first call.
+    Everything except the band profiles and the title is drawn only once,
+    the profiles are updated through the returned lines
+
+    Returns:
+        Tuple (figure,axes,lines), where lines are the heavy holes, light
+        holes and conduction band with tension followed by the valence and
+        conduction band without tension
+    """
+    if 'quantum_well' not in _FIGURES:
+        fig, axes = plt.subplots(figsize=(14,10),nrows=1,ncols=2,dpi=PLOT_DPI)
+        zeros = np.zeros(len(_POSITION))
+        lines = (axes[0].plot(_POSITION,zeros,'b',label='$ E_{V-HEAVY-HOLES}$')[0],
+                 axes[0].plot(_POSITION,zeros,'--c',label='$ E_{V-LIGHT-HOLES}$')[0],
+                 axes[0].plot(_POSITION,zeros,'m',label='$ E_{C-WITH-TENSION} $')[0],
+                 axes[1].plot(_POSITION,zeros,'g',label='$ E_V $')[0],
+                 axes[1].plot(_POSITION,zeros,'r',label='$ E_C $')[0])
+        axes[0].legend(fontsize=12,loc='center left')
+        axes[0].set_title("With tension",fontsize=20)
+        axes[0].set_ylabel('Energy [eV]',fontsize=20)
+        axes[0].set_xlabel('Position [Å]',fontsize=20)
+        axes[0].grid()
+        axes[1].legend(fontsize=12,loc='center right')
+        axes[1].set_title("Without tension",fontsize=20)
+        axes[1].set_xlabel('Position [Å]',fontsize=20)
+        axes[1].grid()
+        _FIGURES['quantum_well'] = (fig,axes,lines)
+    return _FIGURES['quantum_well']
+
+def get_well_mask(well_width:float):
+    """
+    Returns boolean mask of _POSITION which lies inside a quantum well of
+    the given width, masks are cached per width
+    """
+    if well_width not in _WELL_MASKS:
+        _WELL_MASKS[well_width] = ((_POSITION >= int(500-well_width/2.0))
+                                   & (_POSITION < int(501+well_width/2.0)))
+    return _WELL_MASKS[well_width]
+
+def get_save_executor():
+    """
+    Returns the executor writing the PNG files, creating it on the first call
+    """
+    global _SAVE_EXECUTOR
+    if _SAVE_EXECUTOR is None:
+        _SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+    return _SAVE_EXECUTOR
+
+def save_figure(figure, image_name:str):
+    """
+    Renders the figure and saves it as PNG with the fastest zlib compression
+    level. Figures are created with PLOT_DPI so they are rendered directly
+    at the resolution of the saved file. The file is written in a background
+    thread, wait_for_saves has to be called to make sure it exists
+    """
+    figure.canvas.draw()
+    # Copy of the pixels, the figure can be redrawn before the file is written
+    image = np.array(figure.canvas.buffer_rgba())
+    _PENDING_SAVES.append(get_save_executor().submit(matplotlib.image.imsave,image_name,image,
+                                                     dpi=PLOT_DPI,pil_kwargs={"compress_level":1}))
+
+def wait_for_saves():
+    """
+    Waits until all the figures passed to save_figure are written,
+    errors raised while writing are raised here
+    """
+    for save in _PENDING_SAVES:
+        save.result()
+    _PENDING_SAVES.clear()
+
 def calculate_energy(value_a:float, value_b:float, value_c:float):
     """
     This function calculates the energy for given parameters
@@ -69,18 +242,13 @@ def calculate_energy(value_a:float, value_b:float, value_c:float):
         value_b: parameter b
         value_c: parameter c
     Returns:
-        Tuple containing list of xs and their corresponding energy values in (x,y) format
+        Tuple containing array of xs and their corresponding energy values in (x,y) format
     """
-    x_list = [i/100.0 for i in range(101)]
-    energy_list = []
-    for x_val in x_list:
-        energy_value = value_a + value_b*x_val + value_c*x_val*x_val
-        energy_list.append(energy_value)
-    return (x_list,energy_list)
+    return (_X,value_a + _X*(value_b + value_c*_X))
 
 def create_all_plots(x_list,
                     energy_lists:list,
-                    labels:list = [f'Default label #{num}' for num in range(20)],
+                    labels:list = None,
                     material_name:str = 'Default material name',
                     save_to_png:bool = False,
                     show_image:bool = True,
@@ -88,146 +256,208 @@ def create_all_plots(x_list,
     """
     This function generates plot for all the given energies
     """
-    figure, axes = plt.subplots(figsize=(20,16))
+    labels = labels or [f'Default label #{num}' for num in range(len(energy_lists))]
+    figure, axes = get_all_plots_figure()
+    # Lines of the previous plot are reused, missing ones are added and
+    # the surplus removed. Colors are fixed so they follow the line order
+    lines = list(axes.get_lines())
+    for line in lines[len(energy_lists):]:
+        line.remove()
     for i,energy_values in enumerate(energy_lists):
-        axes.plot(x_list,energy_values,label=labels[i])
-    axes.grid()
-    axes.set_ylabel("Energy [eV]",fontsize=FONT_SIZE)
-    axes.set_xlabel(X_LABEL,fontsize=FONT_SIZE)
+        if i < len(lines):
+            lines[i].set_data(x_list,energy_values)
+            lines[i].set_label(labels[i])
+        else:
+            axes.plot(x_list,energy_values,color=f'C{i}',label=labels[i])
+    axes.relim()
+    axes.autoscale_view()
     axes.set_title(material_name,fontsize=FONT_SIZE)
     axes.legend(fontsize=FONT_SIZE)
-    axes.tick_params(axis='both',labelsize=FONT_SIZE-6)
     if show_image:
         figure.show()
         figure.waitforbuttonpress()
     if save_to_png:
-        figure.savefig(image_name)
+        save_figure(figure,image_name)
 
-def get_parameters(parameters:tuple = (0,0,0)):
+def interpolate(values_to_interpolate:tuple,
+                x_list:np.ndarray):
     """
-    Simple function which gets parameters needed for energy calculation
+    Interpolates two values linearly
 
     Args:
-        parameters: a tuple which contains values from which parameters are obtained
+        values_to_interpolate: tuple (a,b) with the value for x=0 and x=1
+        x_list: compositions for which the value is interpolated
     Returns:
-        A tuple (a,b,c), where a,b,c are the needed parameters
+        Array of interpolated values, one per element of x_list
     """
-    a,b_ac,c = parameters
-    b = b_ac - a - c
-    return (a,b,c)
+    value_0,value_1 = values_to_interpolate
+    return value_0 + (value_1 - value_0)*x_list
 
-def interpolate(values_to_interpolate:tuple,
-                x_list:list):
+def interpolate_all(x_list:np.ndarray):
     """
-    Interpolates two values
+    Interpolates all the band parameters at once
+
+    Args:
+        x_list: compositions for which the parameters are interpolated
+    Returns:
+        Array of shape (number of parameters, len(x_list)), rows are indexed
+        by the _VBO, _B, ... constants
     """
-    temp = []
-    for x in x_list:
-        temp.append(values_to_interpolate[0]*(1-x) + values_to_interpolate[1]*x)
-    return temp
+    return _BANDS_A[:,None] + _BANDS_DELTA[:,None]*x_list[None,:]
 
-def include_temperature(energy_gap:list,
-                        x_list: list,
+def include_temperature(energy_gap:np.ndarray,
+                        alpha:np.ndarray,
+                        beta:np.ndarray,
                         temperature: int = 0):
     """
-    Calculates energy gap based on temperature
+    Calculates energy gap based on temperature, alpha and beta are the
+    interpolated Varshni parameters
     """
-    alpha = interpolate(PARAMETERS_TEMPERATURE['alpha'],x_list)
-    beta = interpolate(PARAMETERS_TEMPERATURE['beta'],x_list)
-    new_energy = [energy_gap[i] - (alpha[i]*(temperature**2) / (temperature + beta[i])) for i in range(len(energy_gap))]
-    return new_energy
+    temperature_squared = temperature*temperature
+    return energy_gap - alpha*temperature_squared / (temperature + beta)
 
-def calculate_not_strained_bands(energy_gap:list,
-                                x_list:list):
+class StrainCoefficients(NamedTuple):
+    """
+    Temperature independent parts of the band calculation, see
+    calculate_strain_coefficients
+    """
+    valence_band: np.ndarray
+    conduction_shift: np.ndarray
+    heavy_holes_shift: np.ndarray
+    light_holes_shift: np.ndarray
+
+def calculate_strain_coefficients(x_list:np.ndarray):
+    """
+    Calculates the unstrained valence band and the shifts of the bands
+    caused by strain, none of which depend on temperature
+
+    Args:
+        x_list: compositions for which the coefficients are calculated
+    Returns:
+        StrainCoefficients for the given compositions
+    """
+    interpolated = interpolate_all(x_list)
+    lattice_a_0 = PARAMETERS_BANDS.lattice_a_0
+    interpolated_lattice = interpolated[_LATTICE_A]
+    c11_interpolated = interpolated[_C_11]
+    c12_interpolated = interpolated[_C_12]
+    b_interpolated = interpolated[_B]
+    a_c_interpolated = interpolated[_A_C]
+    a_v_interpolated = interpolated[_A_V]
+    eps_x = (lattice_a_0 - interpolated_lattice)/interpolated_lattice
+    eps_z = -2*eps_x*c12_interpolated/c11_interpolated
+    sum_eps = 2*eps_x + eps_z
+    dE_s = -b_interpolated*(eps_z - eps_x)
+    dE_hv = a_v_interpolated*sum_eps
+    return StrainCoefficients(valence_band=interpolated[_VBO],
+                              conduction_shift=a_c_interpolated*sum_eps,
+                              heavy_holes_shift=dE_hv + dE_s,
+                              light_holes_shift=dE_hv - dE_s)
+
+def calculate_not_strained_bands(energy_gap:np.ndarray,
+                                coefficients:StrainCoefficients):
     """
     Calculates unstrained bands - valence and conduction band
     """
-    valence_band = interpolate(PARAMETERS_BANDS['VBO'],x_list)
-    conduction_band = [valence_band[i] + energy_gap[i] for i in range(len(x_list))]
+    valence_band = coefficients.valence_band
+    conduction_band = valence_band + energy_gap
     return (valence_band,conduction_band)
 
-def calculate_strained_bands(valence_band:list,
-                            conduction_band:list,
-                            x_list:list):
+def calculate_strained_bands(valence_band:np.ndarray,
+                            conduction_band:np.ndarray,
+                            coefficients:StrainCoefficients):
     """
     Calucates the strained bands - conduction, heavy holes and light holes bands
     """
-    lattice_a_0 = PARAMETERS_BANDS['lattice_a_0']
-    interpolated_lattice = interpolate(PARAMETERS_BANDS['lattice_a'],x_list)
-    c11_interpolated = interpolate(PARAMETERS_BANDS['C_11'],x_list)
-    c12_interpolated = interpolate(PARAMETERS_BANDS['C_12'],x_list)
-    b_interpolated = interpolate(PARAMETERS_BANDS['b'],x_list)
-    a_c_interpolated = interpolate(PARAMETERS_BANDS['a_c'],x_list)
-    a_v_interpolated = interpolate(PARAMETERS_BANDS['a_v'],x_list)
-    eps_x_list = [(lattice_a_0 - interpolated_lattice[i])/interpolated_lattice[i] for i in range(len(x_list))]
-    eps_z_list = [eps_x_list[i]*-2*(c12_interpolated[i] / c11_interpolated[i]) for i in range(len(x_list))]
-    dE_s = [-b_interpolated[i] * (eps_z_list[i]-eps_x_list[i]) for i in range(len(x_list))]
-    dE_hc = [a_c_interpolated[i]*(2*eps_x_list[i]+eps_z_list[i]) for i in range(len(x_list))]
-    dE_hv = [a_v_interpolated[i]*(2*eps_x_list[i]+eps_z_list[i]) for i in range(len(x_list))]
-    strained_conduction_band = [conduction_band[i] + dE_hc[i] for i in range(len(x_list))]
-    heavy_holes = [valence_band[i] + dE_hv[i] + dE_s[i] for i in range(len(x_list))]
-    light_holes = [valence_band[i] + dE_hv[i] - dE_s[i] for i in range(len(x_list))]
+    strained_conduction_band = conduction_band + coefficients.conduction_shift
+    heavy_holes = valence_band + coefficients.heavy_holes_shift
+    light_holes = valence_band + coefficients.light_holes_shift
     return (strained_conduction_band,heavy_holes,light_holes)
 
-def create_quantum_well(energy_list: list,
-                            valence_band:list,
-                            conduction_band:list,
-                            heavy_holes: list,
-                            light_holes: list,
-                            conduction_tension: list,
+def create_quantum_well(energy_list: np.ndarray,
+                            valence_band:np.ndarray,
+                            conduction_band:np.ndarray,
+                            heavy_holes: np.ndarray,
+                            light_holes: np.ndarray,
+                            conduction_tension: np.ndarray,
                             well_width: float,
                             composition: int,
-                            temperature: int):
+                            title: str,
+                            image_name: str):
     """
-    This function creates a plot of quantum well with the given material
+    This function creates a plot of quantum well with the given material,
+    title and image_name are prepared by get_quantum_well_labels. It only
+    takes picklable arguments so it can be run in a worker process
+
+    Returns:
+        Tuple (strained,without_strain) of band gaps in the middle of the well
     """
     composition = int(composition * 100)
-    position = [i for i in range(0,1001)]
-    valence_hh = [0 for i in position]
-    valence_lh = [0 for i in position]
-    conduction = [0 + energy_list[0] for i in position]
-    conduction_no_tension = [0 + energy_list[0] for i in position]
-    valence_no_tension = [0 for i in position]
-    for i,x in enumerate(position):
-        if x in range(int(500-well_width/2.0),int(501+well_width/2.0)):
-            valence_hh[i] = heavy_holes[composition] - PARAMETERS_BANDS["VBO"][1]
-            valence_lh[i] = light_holes[composition] - PARAMETERS_BANDS["VBO"][1]
-            conduction[i] = conduction_tension[composition] - PARAMETERS_BANDS["VBO"][1]
-            conduction_no_tension[i] = conduction_band[composition] - PARAMETERS_BANDS["VBO"][1]
-            valence_no_tension[i] = valence_band[composition] - PARAMETERS_BANDS["VBO"][1]
-            if x==500:
-                print(f"temp:{temperature} K,comp:{composition},width:{well_width}")
-                print(f"Strained: {conduction[i]-valence_hh[i]} eV")
-                print(f'Without strain: {conduction_no_tension[i] - valence_no_tension[i]} eV')
-
-    fig, axes = plt.subplots(figsize=(14,10),nrows=1,ncols=2)
-    axes[0].plot(position,valence_hh,'b',label='$ E_{V-HEAVY-HOLES}$')
-    axes[0].plot(position,valence_lh,'--c',label='$ E_{V-LIGHT-HOLES}$')
-    axes[0].plot(position,conduction,'m',label='$ E_{C-WITH-TENSION} $')
-    axes[0].legend(fontsize=12,loc='center left')
-    axes[0].set_title("With tension",fontsize=20)
-    axes[0].set_ylabel('Energy [eV]',fontsize=20)
-    axes[0].set_xlabel('Position [Å]',fontsize=20)
-    axes[0].grid()
-    axes[1].plot(position,valence_no_tension,'g',label='$ E_V $')
-    axes[1].plot(position,conduction_no_tension,'r',label='$ E_C $')
-    axes[1].legend(fontsize=12,loc='center right')
-    axes[1].set_title("Without tension",fontsize=20)
-    axes[1].set_xlabel('Position [Å]',fontsize=20)
-    axes[1].grid()
-    fig.suptitle('$ InAs_{'+f"{composition/100}"+'}Sb_{'+f"{(100-composition)/100}"+'} $ - InAs base for ' + f"T = {temperature}K and width = {int(well_width/10)} nm",fontsize=20)
-    fig.savefig(f"quantum_well_plots\\Quantum_well_{temperature}K_{int(well_width/10)}nm_composition_{composition}.png")
-
-def calculate_critical_mass(position:list):
+    in_well = get_well_mask(well_width)
+    # Band edges inside the well are given relative to the barrier valence band
+    barrier_valence = PARAMETERS_BANDS.VBO[1]
+    valence_hh = np.where(in_well,heavy_holes[composition] - barrier_valence,0.0)
+    valence_lh = np.where(in_well,light_holes[composition] - barrier_valence,0.0)
+    conduction = np.where(in_well,conduction_tension[composition] - barrier_valence,energy_list[0])
+    conduction_no_tension = np.where(in_well,conduction_band[composition] - barrier_valence,energy_list[0])
+    valence_no_tension = np.where(in_well,valence_band[composition] - barrier_valence,0.0)
+    fig, axes, lines = get_quantum_well_figure()
+    profiles = (valence_hh,valence_lh,conduction,valence_no_tension,conduction_no_tension)
+    for line,profile in zip(lines,profiles):
+        line.set_ydata(profile)
+    for axis in axes:
+        axis.relim()
+        axis.autoscale_view()
+    fig.suptitle(title,fontsize=20)
+    save_figure(fig,image_name)
+    return (conduction[500] - valence_hh[500],conduction_no_tension[500] - valence_no_tension[500])
+
+def create_quantum_well_in_worker(*args):
+    """
+    Calls create_quantum_well with the given arguments and waits until the
+    plot is written, so that no save is pending when the worker process ends
+    """
+    well_gaps = create_quantum_well(*args)
+    wait_for_saves()
+    return well_gaps
+
+def get_band_label(band: str,
+                   temperature: int = None):
+    """
+    Builds the legend label of the band, temperature is None for the
+    bands which don't depend on it
+    """
+    return _BAND_LABELS[band].format(temperature=temperature)
+
+def get_quantum_well_labels(temperature: int,
+                            well_width: float,
+                            composition: float):
+    """
+    Builds the title and the file name of a quantum well plot
+
+    Returns:
+        Tuple (title,image_name)
+    """
+    composition = int(composition * 100)
+    title = _QUANTUM_WELL_TITLE.format(x=composition/100,
+                                       one_minus_x=(100-composition)/100,
+                                       temperature=temperature,
+                                       width=int(well_width/10))
+    image_name = _QUANTUM_WELL_IMAGE_NAME.format(temperature=temperature,
+                                                 width=int(well_width/10),
+                                                 composition=composition)
+    return (title,image_name)
+
+def calculate_critical_mass(position:np.ndarray):
     """
     Calculates and plots the critical mass based on composition
     """
     gamma_1_interpolated = interpolate(EFFECTIVE_MASSES['gamma_1'],position)
     gamma_2_interpolated = interpolate(EFFECTIVE_MASSES['gamma_2'],position)
     electron_mass_interpolated = interpolate(EFFECTIVE_MASSES['electron_mass'],position)
-    light_holes_mass = [(gamma_1_interpolated[i] + 2*gamma_2_interpolated[i])**-1 for i in range(len(position))]
-    heavy_holes_mass = [(gamma_1_interpolated[i] - 2*gamma_2_interpolated[i])**-1 for i in range(len(position))]
-    fig, axes = plt.subplots(figsize=(14,10))
+    light_holes_mass = 1.0/(gamma_1_interpolated + 2*gamma_2_interpolated)
+    heavy_holes_mass = 1.0/(gamma_1_interpolated - 2*gamma_2_interpolated)
+    fig, axes = plt.subplots(figsize=(14,10),dpi=PLOT_DPI)
     axes.plot(position,electron_mass_interpolated,'r',linewidth=2,label='electrons')
     axes.plot(position,light_holes_mass,'--c',linewidth=2,label='light holes')
     axes.plot(position,heavy_holes_mass,'b',linewidth=2,label='heavy holes')
@@ -236,40 +466,58 @@ def calculate_critical_mass(position:list):
     axes.set_xlabel(X_LABEL,fontsize=FONT_SIZE)
     axes.set_title('$ InAs_{x}Sb_{1-x} $ - InAs base',fontsize=FONT_SIZE)
     axes.grid()
-    fig.savefig("Effective_mass_plot.png")
+    save_figure(fig,"Effective_mass_plot.png")
+
+def matthews_blakeslee_coefficients(interpolated_lattice:np.ndarray,
+                                    c11_interpolated:np.ndarray,
+                                    c12_interpolated:np.ndarray):
+    """
+    Calculates the composition dependent part of the Matthews Blakeslee model.
+    Lattice matched compositions (no mismatch) get an infinite prefactor,
+    for which bisection finds no zero and returns NaN
 
-def matthews_blakeslee_model(h_c,i,x_list):
+    Returns:
+        Tuple (b,prefactor) with arguments for matthews_blakeslee_model
+    """
+    lattice_a_0 = PARAMETERS_BANDS.lattice_a_0
+    b = interpolated_lattice / _SQRT2
+    v = c12_interpolated / (c11_interpolated + c12_interpolated)
+    f = np.abs((lattice_a_0 - interpolated_lattice)/interpolated_lattice)
+    with np.errstate(divide='ignore'):
+        prefactor = (b / (2*f*pi)) * ((1-0.25*v) / (1+v))
+    return (b,prefactor)
+
+def matthews_blakeslee_model(h_c,b:np.ndarray,prefactor:np.ndarray):
     """
-    Matthews Blakeslee model changed for zero search
+    Matthews Blakeslee model changed for zero search, evaluated for
+    all the given compositions at once
     """
-    lattice_a_0 = PARAMETERS_BANDS['lattice_a_0']
-    interpolated_lattice = interpolate(PARAMETERS_BANDS['lattice_a'],x_list)
-    c11_interpolated = interpolate(PARAMETERS_BANDS['C_11'],x_list)
-    c12_interpolated = interpolate(PARAMETERS_BANDS['C_12'],x_list)
-    b = interpolated_lattice[i] / sqrt(2)
-    v = c12_interpolated[i] / (c11_interpolated[i] + c12_interpolated[i])
-    f = abs((lattice_a_0 - interpolated_lattice[i])/interpolated_lattice[i])
-    y = (b / (2*f*pi)) * ((1-0.25*v) / (1+v)) * (log(h_c / b) + 1) - h_c
-    return y
+    return prefactor * (np.log(h_c / b) + 1) - h_c
 
-def bisection(function,x_min,x_max,args,tolerance: float = 10**-12):
+def bisection(function,x_min:np.ndarray,x_max:np.ndarray,args:tuple,iterations: int = 50):
     """
-    Bisection function for finding zeros in a given function
+    Bisection function for finding zeros in a given function, solves
+    for every element of x_min and x_max simultaneously. Elements without
+    a sign change in their interval are returned as NaN
     """
+    f_min = function(x_min,*args)
+    f_max = function(x_max,*args)
     x_intercept = (x_min + x_max) / 2.0
-    i = args[0]
-    x_list = args[1]
-    if function(x_min,i,x_list)*function(x_intercept,i,x_list)<=0 and function(x_max,i,x_list)*function(x_intercept,i,x_list)<=0:
-        return bisection(function,x_intercept,x_max,args,tolerance)
-    while abs(function(x_intercept,i,x_list))>tolerance:
-        if function(x_min,i,x_list)*function(x_intercept,i,x_list)<=0:
-            x_max = x_intercept
-        elif function(x_max,i,x_list)*function(x_intercept,i,x_list)<=0:
-            x_min = x_intercept
-        else:
-            return None
+    f_intercept = function(x_intercept,*args)
+    # If both halves contain a zero we look for the one in the upper half
+    upper_half = (f_min*f_intercept<=0) & (f_max*f_intercept<=0)
+    x_min = np.where(upper_half,x_intercept,x_min)
+    f_min = np.where(upper_half,f_intercept,f_min)
+    has_zero = f_min*f_max<=0
+    # Only the new midpoint is evaluated, f_min follows x_min
+    for _ in range(iterations):
         x_intercept = (x_min + x_max) / 2.0
-    return x_intercept
+        f_intercept = function(x_intercept,*args)
+        lower_half = f_min*f_intercept<=0
+        x_max = np.where(lower_half,x_intercept,x_max)
+        x_min = np.where(lower_half,x_min,x_intercept)
+        f_min = np.where(lower_half,f_min,f_intercept)
+    return np.where(has_zero,(x_min + x_max) / 2.0,np.nan)
 
 
 def calculate_critical_thickness(x_list):
@@ -277,90 +525,120 @@ def calculate_critical_thickness(x_list):
     Calculates and plots critical thickness as a function of composition
     """
     no_iterations = len(x_list) - 1
-    temp = []
-    for i in range(no_iterations):
-        h_c = bisection(matthews_blakeslee_model,10,7000,args=(i,x_list))
-        temp.append(h_c)
-    temp.append(3*temp[no_iterations-1])
-    plt.figure(figsize=(12,8))
+    interpolated = interpolate_all(x_list[:no_iterations])
+    temp = np.empty(len(x_list))
+    temp[:no_iterations] = bisection(matthews_blakeslee_model,
+                                     np.full(no_iterations,10.0),
+                                     np.full(no_iterations,7000.0),
+                                     args=matthews_blakeslee_coefficients(interpolated[_LATTICE_A],
+                                                                          interpolated[_C_11],
+                                                                          interpolated[_C_12]))
+    # The last composition is lattice matched to the substrate, its critical
+    # thickness is infinite so it is drawn at 3 times the previous value
+    temp[no_iterations] = 3*temp[no_iterations-1]
+    plt.figure(figsize=(12,8),dpi=PLOT_DPI)
     plt.plot(x_list,temp)
     plt.title("Critical thickness for " + PLOT_TITLE + "on InAs",fontsize=FONT_SIZE)
     plt.xlabel(X_LABEL,fontsize=FONT_SIZE)
     plt.ylabel(r"Critical thickness [$ \AA $]",fontsize=FONT_SIZE)
-    plt.savefig("Critical_thickness.png")
-    plt.figure(figsize=(12,8))
-    plt.plot(x_list[0:int(no_iterations / 2)],temp[0:int(no_iterations / 2)])
+    save_figure(plt.gcf(),"Critical_thickness.png")
+    plt.figure(figsize=(12,8),dpi=PLOT_DPI)
+    plt.plot(x_list[:no_iterations // 2],temp[:no_iterations // 2])
     plt.title("Critical thickness for " + PLOT_TITLE + " on InAs - reduced",fontsize=FONT_SIZE)
     plt.xlabel(X_LABEL,fontsize=FONT_SIZE)
     plt.ylabel(r"Critical thickness [$ \AA $]",fontsize=FONT_SIZE)
-    plt.savefig("Critical_thickness_reduced.png")
+    save_figure(plt.gcf(),"Critical_thickness_reduced.png")
 
 def main():
     """
     Main of the whole module, invokes all the functions needed for
     the calculation and plot of the material
     """
-    energy_lists = []
-    for params in PARAMETERS_BANDGAP:
-        a_val,b_val,c_val = get_parameters(params)
-        x_list,energy_list = calculate_energy(value_a=a_val,value_b=b_val,value_c=c_val)
-        energy_lists.append(energy_list)
+    x_list = _X
+    energy_lists = np.empty((len(PARAMETERS_BANDGAP),len(x_list)))
+    for i,params in enumerate(PARAMETERS_BANDGAP):
+        # y = a + bx + cx^2 passes through B_BC at x=0 and B_AC at x=1
+        a_val,b_ac,c_val = params
+        b_val = b_ac - a_val - c_val
+        _,energy_lists[i] = calculate_energy(value_a=a_val,value_b=b_val,value_c=c_val)
     create_all_plots(x_list,energy_lists,LABELS,PLOT_TITLE,SAVE_PLOT_AS_PNG,SHOW_IMAGE)
     calculate_critical_thickness(x_list)
+    # Composition dependent parameters don't change with temperature
+    coefficients = calculate_strain_coefficients(x_list)
     if PLOT_BANDS and not TEMPERATURE_DEPENDENCE:
         energy_gap = energy_lists[0]
-        valence_band,conduction_band = calculate_not_strained_bands(energy_gap,x_list)
+        valence_band,conduction_band = calculate_not_strained_bands(energy_gap,coefficients)
         strained_conduction_band, heavy_holes,light_holes = calculate_strained_bands(valence_band,
                                                                                     conduction_band,
-                                                                                    x_list)
+                                                                                    coefficients)
         band_list = [valence_band,conduction_band,strained_conduction_band,heavy_holes,light_holes]
         labels = ['$ E_V $', '$ E_C $', '$ E_{C-with-strain} $', '$ E_{HH} $', '$ E_{LH} $']
         create_all_plots(x_list,band_list,labels,PLOT_TITLE,
                         SAVE_PLOT_AS_PNG,SHOW_IMAGE,'Energy_bands_with_strain.png')
     if PLOT_BANDS and TEMPERATURE_DEPENDENCE:
-        all_bands = []
-        all_labels = []
-        for i,temperature in enumerate(PARAMETERS_TEMPERATURE['Temperatures']):
-            energy_gap = include_temperature(energy_lists[0],x_list,temperature)
-            valence_band,conduction_band = calculate_not_strained_bands(energy_gap,x_list)
+        temperatures = PARAMETERS_TEMPERATURE.Temperatures
+        # Bands keyed by (band,temperature), temperature is None for the bands
+        # which don't depend on it. band_keys are in the order of the final plot
+        bands = {}
+        band_keys = []
+        compositions = QUANTUM_WELL_PARAMS['Compositions']
+        widths = QUANTUM_WELL_PARAMS['Well_widths']
+        well_labels = {(temperature,width,composition):
+                       get_quantum_well_labels(temperature,width,composition)
+                       for temperature in temperatures
+                       for width in widths
+                       for composition in compositions}
+        well_keys = []
+        well_jobs = []
+        alpha = interpolate(PARAMETERS_TEMPERATURE.alpha,x_list)
+        beta = interpolate(PARAMETERS_TEMPERATURE.beta,x_list)
+        for i,temperature in enumerate(temperatures):
+            energy_gap = include_temperature(energy_lists[0],alpha,beta,temperature)
+            valence_band,conduction_band = calculate_not_strained_bands(energy_gap,coefficients)
             strained_conduction_band, heavy_holes,light_holes = calculate_strained_bands(valence_band,
                                                                                         conduction_band,
-                                                                                        x_list)
-            # We generate valence, hh and lh band only for 1st T since they're not T dependent
+                                                                                        coefficients)
+            bands[('EC',temperature)] = conduction_band
+            bands[('ECS',temperature)] = strained_conduction_band
+            conduction_keys = [('EC',temperature),('ECS',temperature)]
+            # We store valence, hh and lh band only for 1st T since they're not T dependent
             if not i:
-                band_list = [valence_band,conduction_band,
-                            strained_conduction_band,heavy_holes,light_holes]
-                labels = ['$ E_V $', f'$ E_C ({temperature}K) $',
-                         '$ E_{C-with-strain} '+ f'({temperature}K) $', '$ E_{HH} $', '$ E_{LH} $']
-                single_temp_bands = band_list
-                single_temp_labels = labels
+                bands.update({('EV',None):valence_band,('EHH',None):heavy_holes,('ELH',None):light_holes})
+                keys = [('EV',None),*conduction_keys,('EHH',None),('ELH',None)]
+                band_keys.extend(keys)
             else:
-                band_list = [conduction_band,strained_conduction_band]
-                labels = [f'$ E_C ({temperature}K) $','$ E_{C-with-strain} '+ f'({temperature}K) $']
-                single_temp_bands = [all_bands[0],all_bands[3],all_bands[4]]
-                single_temp_labels = [all_labels[0],all_labels[3],all_labels[4]]
-                single_temp_bands.extend(band_list)
-                single_temp_labels.extend(labels)
-            all_bands.extend(band_list)
-            all_labels.extend(labels)
-            create_all_plots(x_list,single_temp_bands,single_temp_labels,PLOT_TITLE,
-                        SAVE_PLOT_AS_PNG,SHOW_IMAGE,f'Energy_bands_with_strain_for_{temperature}K.png')
-            compositions = QUANTUM_WELL_PARAMS['Compositions']
-            widths = QUANTUM_WELL_PARAMS['Well_widths']
+                keys = [('EV',None),('EHH',None),('ELH',None),*conduction_keys]
+                band_keys.extend(conduction_keys)
+            create_all_plots(x_list,[bands[key] for key in keys],[get_band_label(*key) for key in keys],
+                        PLOT_TITLE,SAVE_PLOT_AS_PNG,SHOW_IMAGE,f'Energy_bands_with_strain_for_{temperature}K.png')
             for width in widths:
                 for composition in compositions:
-                    create_quantum_well(energy_list = energy_list,
-                                    valence_band=valence_band,
-                                    conduction_band=conduction_band,
-                                    heavy_holes = heavy_holes,
-                                    light_holes = light_holes,
-                                    conduction_tension = strained_conduction_band,
-                                    well_width = width,
-                                    composition = composition,
-                                    temperature = temperature)
-        create_all_plots(x_list,all_bands,all_labels,PLOT_TITLE,
+                    title,image_name = well_labels[(temperature,width,composition)]
+                    well_keys.append((temperature,width,composition))
+                    well_jobs.append((energy_lists[-1],valence_band,conduction_band,
+                                      heavy_holes,light_holes,strained_conduction_band,
+                                      width,composition,title,image_name))
+        create_all_plots(x_list,[bands[key] for key in band_keys],
+                        [get_band_label(*key) for key in band_keys],PLOT_TITLE,
                         SAVE_PLOT_AS_PNG,SHOW_IMAGE,'Energy_bands_with_strain_and_temperature.png')
+        # Quantum wells don't depend on each other so they are plotted in parallel.
+        # Every worker gets one chunk of consecutive wells so it draws them all
+        # into its cached figure. Workers are spawned so they don't inherit the
+        # save threads of this process
+        processes = min(len(well_jobs),os.cpu_count() or 1)
+        if processes > 1:
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                well_gaps = pool.starmap(create_quantum_well_in_worker,well_jobs,
+                                         chunksize=-(-len(well_jobs) // processes))
+        else:
+            well_gaps = [create_quantum_well(*job) for job in well_jobs]
+        for (temperature,width,composition),(strained,without_strain) in zip(well_keys,well_gaps):
+            print(f"temp:{temperature} K,comp:{int(composition * 100)},width:{width}")
+            print(f"Strained: {strained} eV")
+            print(f'Without strain: {without_strain} eV')
     calculate_critical_mass(x_list)
+    wait_for_saves()
+    close_figures()
     return 0
 
 if __name__ == '__main__':